@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 from flask import Flask, render_template, make_response, request, jsonify, \
-    redirect, send_from_directory, Response
+    redirect, send_from_directory, Response, abort
 from flask_caching import Cache
+import copy
 import json
 import os
 import tempfile
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import icalendar
 import datetime
 from dateutil.rrule import rrulestr
@@ -14,6 +16,7 @@ import yaml
 import traceback
 import io
 import sys
+from conversion_base import ConversionStrategy
 from convert_to_dhtmlx import ConvertToDhtmlx
 from convert_to_ics import ConvertToICS
 import pytz
@@ -24,6 +27,9 @@ import mimetypes
 DEBUG = os.environ.get("APP_DEBUG", "true").lower() == "true"
 PORT = int(os.environ.get("PORT", "5000"))
 CACHE_REQUESTED_URLS_FOR_SECONDS = int(os.environ.get("CACHE_REQUESTED_URLS_FOR_SECONDS", 600))
+CACHE_URL_VALIDATORS_FOR_SECONDS = int(os.environ.get("CACHE_URL_VALIDATORS_FOR_SECONDS", 24 * 60 * 60))
+CACHE_TYPE = os.environ.get("CACHE_TYPE", "SimpleCache")
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
 
 # constants
 HERE = os.path.dirname(__file__) or "."
@@ -32,12 +38,28 @@ TEMPLATE_FOLDER_NAME = "templates"
 TEMPLATE_FOLDER = os.path.join(HERE, TEMPLATE_FOLDER_NAME)
 CALENDARS_TEMPLATE_FOLDER_NAME = "calendars"
 CALENDAR_TEMPLATE_FOLDER = os.path.join(TEMPLATE_FOLDER, CALENDARS_TEMPLATE_FOLDER_NAME)
+CALENDAR_TEMPLATE_NAMES = frozenset(os.listdir(CALENDAR_TEMPLATE_FOLDER))
 STATIC_FOLDER_NAME = "static"
 STATIC_FOLDER_PATH = os.path.join(HERE, STATIC_FOLDER_NAME)
+STATIC_FOLDER_NAMES = frozenset(
+    folder_name for folder_name in os.listdir(STATIC_FOLDER_PATH)
+    if os.path.isdir(os.path.join(STATIC_FOLDER_PATH, folder_name)))
 DHTMLX_LANGUAGES_FILE = os.path.join(STATIC_FOLDER_PATH, "js", "dhtmlx", "locale", "languages.json")
 DEFAULT_REQUEST_HEADERS = {
   "user-agent": "open-web-calendar",
 }
+REQUEST_TIMEOUT = (3.05, 27) # connect, read - see https://requests.readthedocs.io/en/latest/user/advanced/#timeouts
+
+# Use one session for all requests so that connections to the
+# calendar hosts are pooled and kept alive instead of performing
+# a TCP+TLS handshake for every fetch.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=ConversionStrategy.MAXIMUM_THREADS,
+    max_retries=Retry(total=2, backoff_factor=0.2))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 # specification
 PARAM_SPECIFICATION_URL = "specification_url"
@@ -45,21 +67,27 @@ PARAM_SPECIFICATION_URL = "specification_url"
 # globals
 app = Flask(__name__, template_folder="templates")
 # Check Configuring Flask-Cache section for more details
-CACHE_CONFIG = {
-    'CACHE_TYPE': 'FileSystemCache',
-    'CACHE_DIR': tempfile.mkdtemp(prefix="owc-cache-")}
+# SimpleCache keeps the cached values in process memory and avoids
+# a pickle and file write per cache entry. Use RedisCache when several
+# worker processes should share the cache.
+CACHE_CONFIG = {'CACHE_TYPE': CACHE_TYPE}
+if CACHE_TYPE == "FileSystemCache":
+    CACHE_CONFIG['CACHE_DIR'] = tempfile.mkdtemp(prefix="owc-cache-")
+    CACHE_CONFIG['CACHE_THRESHOLD'] = 500 # prune old files, see https://cachelib.readthedocs.io/en/stable/file/
+elif CACHE_TYPE == "RedisCache":
+    CACHE_CONFIG['CACHE_REDIS_URL'] = CACHE_REDIS_URL
 cache = Cache(app, config=CACHE_CONFIG)
+# The parsed calendars are not cheap to pickle, so they are memoized
+# in process memory instead of the file system cache.
+parsed_cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
 
 # caching
 
-__URL_CACHE = {}
 def cache_url(url, text):
     """Cache the value of a url."""
-    __URL_CACHE[url] = text
-    try:
-        get_text_from_url(url)
-    finally:
-        del __URL_CACHE[url]
+    key = get_text_from_url.make_cache_key(get_text_from_url.uncached, url)
+    cache.set(key, text, timeout=CACHE_REQUESTED_URLS_FOR_SECONDS)
+    parsed_cache.delete_memoized(get_calendars_from_url, url)
 
 
 @app.after_request
@@ -91,10 +119,12 @@ def get_configuration():
 
 def set_JS_headers(response):
     response = make_response(response)
-    response.headers['Access-Control-Allow-Origin'] = '*'
     # see https://developer.mozilla.org/en-US/docs/Web/HTTP/CORS/Errors/CORSMissingAllowHeaderFromPreflight
-    response.headers['Access-Control-Allow-Headers'] = request.headers.get("Access-Control-Request-Headers")
-    response.headers['Content-Type'] = 'text/calendar'
+    response.headers.update({
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': request.headers.get("Access-Control-Request-Headers"),
+        'Content-Type': 'text/calendar',
+    })
     return response
 
 def set_js_headers(func):
@@ -112,22 +142,76 @@ def make_js_file_response(content:str) -> Response:
     return response
 
 
-@cache.memoize(
-    CACHE_REQUESTED_URLS_FOR_SECONDS,
-    forced_update=lambda: bool(__URL_CACHE))
+# Validators and bodies of urls which support conditional requests are
+# stored in the cache backend as (etag, last_modified, content), keyed by
+# the url. They outlive the memoized content so an unchanged feed answers
+# a revalidation with 304 and is not downloaded again, and the backend
+# evicts them like any other entry.
+VALIDATOR_KEY_PREFIX = "url-validator/"
+
+@cache.memoize(CACHE_REQUESTED_URLS_FOR_SECONDS)
 def get_text_from_url(url):
-    """Return the text from a url.
+    """Return the content of a url as bytes.
+
+    The result is cached CACHE_REQUESTED_URLS_FOR_SECONDS. After that,
+    a conditional request revalidates the content, so unchanged feeds
+    skip the download.
+    """
+    headers = DEFAULT_REQUEST_HEADERS
+    cached = cache.get(VALIDATOR_KEY_PREFIX + url)
+    if cached:
+        etag, last_modified, _ = cached
+        headers = dict(headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    response = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    if cached and response.status_code == 304:
+        response.close() # a 304 has no body; return the connection to the pool
+        return cached[2]
+    # Stream the raw body and hand the bytes straight to the parser.
+    # icalendar decodes them itself, so we skip requests' full .text
+    # unicode pass and its extra copy of the buffer.
+    response.raw.decode_content = True
+    content = response.content
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.set(VALIDATOR_KEY_PREFIX + url, (etag, last_modified, content),
+                  timeout=CACHE_URL_VALIDATORS_FOR_SECONDS)
+    elif cached:
+        cache.delete(VALIDATOR_KEY_PREFIX + url)
+    return content
+
+@parsed_cache.memoize(CACHE_REQUESTED_URLS_FOR_SECONDS)
+def get_calendars_from_url(url):
+    """Return the parsed calendars from a url.
+
+    Parsing a big calendar is expensive, so the result is cached
+    CACHE_REQUESTED_URLS_FOR_SECONDS alongside the url content.
+    """
+    return icalendar.Calendar.from_ical(get_text_from_url(url), multiple=True)
+
+def get_calendar_template_names():
+    """Return the valid calendar template names.
 
-    The result is cached CACHE_REQUESTED_URLS_FOR_SECONDS.
+    The folder content does not change in production, so it is listed
+    once at import time. In debug mode, it is listed again so new
+    templates show up without a restart.
     """
-    if __URL_CACHE:
-        return __URL_CACHE[url]
-    return requests.get(url, headers=DEFAULT_REQUEST_HEADERS).content
+    if DEBUG:
+        return os.listdir(CALENDAR_TEMPLATE_FOLDER)
+    return CALENDAR_TEMPLATE_NAMES
+
+# The default specification is immutable at runtime, so it is parsed
+# only once and copied for each request.
+with open(DEFAULT_SPECIFICATION_PATH, encoding="UTF-8") as _file:
+    DEFAULT_SPECIFICATION = yaml.safe_load(_file)
 
 def get_default_specification():
     """Return the default specification."""
-    with open(DEFAULT_SPECIFICATION_PATH, encoding="UTF-8") as file:
-        return yaml.safe_load(file)
+    return copy.deepcopy(DEFAULT_SPECIFICATION)
 
 def get_specification(query=None):
     """Build the calendar specification."""
@@ -143,13 +227,10 @@ def get_specification(query=None):
         except json.JSONDecodeError:
             url_specification_values = yaml.safe_load(url_specification_response)
         specification.update(url_specification_values)
-    for parameter in query:
-        # get a list of arguments
-        # see https://web.archive.org/web/20230325034825/https://werkzeug.palletsprojects.com/en/0.14.x/datastructures/
-        value = query.getlist(parameter, None)
-        if len(value) == 1:
-            value = value[0]
-        specification[parameter] = value
+    # iterate the key/values pairs once instead of a getlist per key
+    # see https://web.archive.org/web/20230325034825/https://werkzeug.palletsprojects.com/en/0.14.x/datastructures/
+    for parameter, values in query.lists():
+        specification[parameter] = values[0] if len(values) == 1 else values
     return specification
 
 
@@ -161,7 +242,6 @@ def render_app_template(template, specification):
     return render_template(template,
         specification=specification,
         configuration = get_configuration(),
-        json=json,
         get_query_string=get_query_string,
         html=lambda id, **template_replacements: translate.html(specification["language"], translation_file, id, **template_replacements)
     )
@@ -175,28 +255,30 @@ def get_calendar(type):
     if type == "spec":
         return jsonify(specification)
     if type == "events.json":
-        strategy = ConvertToDhtmlx(specification, get_text_from_url)
+        strategy = ConvertToDhtmlx(specification, get_calendars_from_url)
         strategy.retrieve_calendars()
         return strategy.merge()
     if type == "ics":
-        strategy = ConvertToICS(specification, get_text_from_url)
+        strategy = ConvertToICS(specification, get_calendars_from_url)
         strategy.retrieve_calendars()
         return strategy.merge()
     if type == "html":
         template_name = specification["template"]
-        all_template_names = os.listdir(CALENDAR_TEMPLATE_FOLDER)
+        all_template_names = get_calendar_template_names()
         assert template_name in all_template_names, "Template names must be file names like \"{}\", not \"{}\".".format("\", \"".join(all_template_names), template_name)
         template = CALENDARS_TEMPLATE_FOLDER_NAME + "/" + template_name
         return render_app_template(template, specification)
     raise ValueError("Cannot use extension {}. Please see the documentation or report an error.".format(type))
 
-for folder_name in os.listdir(STATIC_FOLDER_PATH):
-    folder_path = os.path.join(STATIC_FOLDER_PATH, folder_name)
-    if not os.path.isdir(folder_path):
-        continue
-    @app.route('/' + folder_name + '/<path:path>', endpoint="static/" + folder_name)
-    def send_static(path, folder_name=folder_name):
-        return send_from_directory('static/' + folder_name, path)
+@app.route('/<folder_name>/<path:path>')
+def send_static(folder_name, path):
+    """Serve the files of the static folders.
+
+    One rule for all folders keeps the url map small.
+    """
+    if folder_name not in STATIC_FOLDER_NAMES:
+        abort(404)
+    return send_from_directory(STATIC_FOLDER_NAME + '/' + folder_name, path)
 
 @app.route("/")
 @app.route("/index.html")
@@ -209,9 +291,13 @@ def serve_about():
     specification = get_specification()
     return render_app_template("about.html", specification)
 
+# The configuration does not change at runtime, so the content of
+# /configuration.js is generated once instead of on every request.
+CONFIGURATION_JS = "/* generated */\nconst configuration = {};".format(json.dumps(get_configuration()))
+
 @app.route("/configuration.js")
 def serve_configuration():
-    return make_js_file_response("/* generated */\nconst configuration = {};".format(json.dumps(get_configuration())))
+    return make_js_file_response(CONFIGURATION_JS)
 
 @app.route("/locale_<lang>.js")
 def serve_locale(lang):
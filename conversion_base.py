@@ -6,9 +6,15 @@ import traceback
 import io
 from icalendar import Calendar
 
-def get_text_from_url(url):
-    """Return the text from a url."""
-    return requests.get(url).text
+def get_calendars_from_url(url):
+    """Return the parsed calendars from a url."""
+    return Calendar.from_ical(requests.get(url).content, multiple=True)
+
+
+# One thread pool for all requests: it lives as long as the process, so
+# the threads and their stacks are not created and torn down per request.
+# The pool grows lazily up to max_workers and more urls are queued.
+EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="calendar")
 
 
 class ConversionStrategy:
@@ -16,12 +22,12 @@ class ConversionStrategy:
 
     # TODO: add as parameters
     MAXIMUM_THREADS = 100
-    
-    def __init__(self, specification, get_text_from_url=get_text_from_url):
+
+    def __init__(self, specification, get_calendars_from_url=get_calendars_from_url):
         self.specification = specification
         self.lock = RLock()
         self.components = []
-        self.get_text_from_url = get_text_from_url
+        self.get_calendars_from_url = get_calendars_from_url
         self.created()
         
     def created(self):
@@ -37,22 +43,37 @@ class ConversionStrategy:
         urls = self.specification["url"]
         if isinstance(urls, str):
             urls = [urls]
-        assert len(urls) <= self.MAXIMUM_THREADS, "You can only merge {} urls. If you like more, open an issue.".format(MAXIMUM_THREADS)
-        with ThreadPoolExecutor(max_workers=self.MAXIMUM_THREADS) as e:
-            for e in e.map(self.retrieve_calendar, urls):
-                pass # no error should pass silently; import this
-    
+        assert len(urls) <= self.MAXIMUM_THREADS, "You can only merge {} urls. If you like more, open an issue.".format(self.MAXIMUM_THREADS)
+        url_calendars = []
+        for url, calendars in zip(urls, EXECUTOR.map(self.retrieve_calendar, urls)):
+            for calendar in calendars:
+                url_calendars.append((url, calendar))
+        # Collect the components of each calendar in its own worker so
+        # that the expansion of one calendar overlaps with the downloads
+        # and expansions of its siblings.
+        for _ in EXECUTOR.map(self.collect_calendar_components, url_calendars):
+            pass # no error should pass silently; import this
+
     def retrieve_calendar(self, url):
-        """Retrieve a calendar from a url"""
+        """Retrieve the calendars from a url"""
         try:
-            calendar_text = self.get_text_from_url(url)
-            calendars = Calendar.from_ical(calendar_text, multiple=True)
-            self.collect_components_from(calendars)
+            return self.get_calendars_from_url(url)
         except:
             ty, err, tb = sys.exc_info()
             with self.lock:
                 self.components.append(self.error(ty, err, tb, url))
-     
+            return []
+
+    def collect_calendar_components(self, url_calendar):
+        """Collect the components from one (url, calendar) tuple."""
+        url, calendar = url_calendar
+        try:
+            self.collect_components_from([calendar])
+        except:
+            ty, err, tb = sys.exc_info()
+            with self.lock:
+                self.components.append(self.error(ty, err, tb, url))
+
     def collect_components_from(self, calendars):
         """Collect all the compenents from the calendar."""
         raise NotImplementedError("to be implemented in subclasses")
@@ -1,5 +1,6 @@
 import datetime
-from flask import jsonify
+import orjson
+from flask import Response
 from conversion_base import ConversionStrategy
 import recurring_ical_events
 import icalendar
@@ -12,6 +13,65 @@ def is_date(date):
     return isinstance(date, datetime.date) and not isinstance(date, datetime.datetime)
 
 
+# Margin for the event pre-filter so that no time zone offset can move
+# an event across the boundary of the time span.
+DATE_MARGIN = datetime.timedelta(days=1)
+
+# The default time span reaches one year into the past and the future.
+# A timedelta avoids datetime.replace(year=...) which raises on leap days.
+ONE_YEAR = datetime.timedelta(days=366)
+
+
+def as_date(value):
+    """Return the date of a date or datetime."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def without_events_outside(calendar, from_date, to_date):
+    """Return a calendar without the events that cannot occur in the time span.
+
+    rrule parses UNTIL but still iterates all occurrences from DTSTART,
+    see https://github.com/niccokunzmann/open-web-calendar/issues/258.
+    Dropping events that certainly end before the time span or start after
+    it skips their whole expansion. The comparison uses dates with a margin
+    of one day, so events which might occur in the time span are kept.
+    """
+    lower = as_date(from_date) - DATE_MARGIN
+    upper = as_date(to_date) + DATE_MARGIN
+    modified_uids = set() # these events are edited occurrences of others
+    for event in calendar.walk("VEVENT"):
+        if "RECURRENCE-ID" in event:
+            modified_uids.add(str(event.get("UID", "")))
+    subcomponents = []
+    for component in calendar.subcomponents:
+        if component.name == "VEVENT" and component.get("DTSTART") is not None \
+                and "RDATE" not in component \
+                and str(component.get("UID", "")) not in modified_uids:
+            start = as_date(component["DTSTART"].dt)
+            if start > upper:
+                continue
+            end = start
+            if "DTEND" in component:
+                end = as_date(component["DTEND"].dt)
+            elif "DURATION" in component:
+                end = as_date(component["DTSTART"].dt + component["DURATION"].dt)
+            rrule = component.get("RRULE")
+            if rrule:
+                # the last occurrence starts at UNTIL but still lasts as
+                # long as the event, so it can reach into the time span
+                until = rrule.get("UNTIL")
+                if until and max(map(as_date, until)) + (end - start) < lower:
+                    continue
+            elif end < lower:
+                continue
+        subcomponents.append(component)
+    slimmed_calendar = icalendar.Calendar(calendar)
+    slimmed_calendar.subcomponents = subcomponents
+    return slimmed_calendar
+
+
 class ConvertToDhtmlx(ConversionStrategy):
     """Convert events to dhtmlx. This conforms to a stratey pattern.
 
@@ -25,6 +85,9 @@ class ConvertToDhtmlx(ConversionStrategy):
             self.timezone = pytz.timezone(self.specification["timezone"])
         except pytz.UnknownTimeZoneError:
             self.timezone = pytz.FixedOffset(-int(self.specification["timeshift"]))
+        # Serializing every event back to ICS text is expensive and
+        # rarely used, so it is only included on request.
+        self.include_ical = str(self.specification.get("include_ical", False)).lower() == "true"
 
     def date_to_string(self, date):
         """Convert a date to a string."""
@@ -33,49 +96,56 @@ class ConvertToDhtmlx(ConversionStrategy):
         # see https://docs.python.org/3/library/datetime.html#datetime.datetime.isoformat
         # see https://docs.python.org/3/library/datetime.html#strftime-and-strptime-behavior
         if is_date(date):
-            date = datetime.datetime(date.year, date.month, date.day, tzinfo=self.timezone)
-        elif date.tzinfo is None:
+            # dates have no time zone, so they are shown as-is
+            return f"{date:%Y-%m-%d} 00:00"
+        if date.tzinfo is None:
             date = self.timezone.localize(date)
         # convert to other timezone, see https://stackoverflow.com/a/54376154
-        viewed_date = date.astimezone(self.timezone)
-        return viewed_date.strftime("%Y-%m-%d %H:%M")
+        return date.astimezone(self.timezone).strftime("%Y-%m-%d %H:%M")
 
     def convert_ical_event(self, calendar_event):
+        # CaselessDict.get is a hot function, so bind it once and look
+        # every property up only once.
+        get = calendar_event.get
         start = calendar_event["DTSTART"].dt
-        end = calendar_event.get("DTEND", calendar_event["DTSTART"]).dt
+        end = get("DTEND", calendar_event["DTSTART"]).dt
         if is_date(start) and is_date(end) and end == start:
             end = datetime.timedelta(days=1) + start
-        geo = calendar_event.get("GEO", None)
+        geo = get("GEO", None)
         if geo:
             geo = {"lon": geo.longitude, "lat": geo.latitude}
-        name = calendar_event.get("SUMMARY", "")
-        sequence = str(calendar_event.get("SEQUENCE", 0))
-        uid = calendar_event.get("UID", "") # issue 69: UID is helpful for debugging but not required
+        name = get("SUMMARY", "")
+        sequence = str(get("SEQUENCE", 0))
+        uid = get("UID", "") # issue 69: UID is helpful for debugging but not required
         start_date = self.date_to_string(start)
-        categories = calendar_event.get("CATEGORIES", None)
+        start_date_iso = start.isoformat()
+        end_date_iso = end.isoformat()
+        categories = get("CATEGORIES", None)
         if categories and isinstance(categories, icalendar.prop.vCategory):
             categories = categories.to_ical().decode("UTF-8").replace(",", " | ")
-        return {
+        event = {
             "start_date": start_date,
             "end_date": self.date_to_string(end),
-            "start_date_iso": start.isoformat(),
-            "end_date_iso": end.isoformat(),
-            "start_date_iso_0": start.isoformat(),
-            "end_date_iso_0": end.isoformat(),
+            "start_date_iso": start_date_iso,
+            "end_date_iso": end_date_iso,
+            "start_date_iso_0": start_date_iso,
+            "end_date_iso_0": end_date_iso,
             "text":  name,
-            "description": calendar_event.get("DESCRIPTION", ""),
-            "location": calendar_event.get("LOCATION", None),
+            "description": get("DESCRIPTION", ""),
+            "location": get("LOCATION", None),
             "geo": geo,
             "uid": uid,
-            "ical": calendar_event.to_ical().decode("UTF-8"),
             "sequence": sequence,
             "recurrence": None,
-            "url": calendar_event.get("URL"),
-            "id": (uid, start_date),
+            "url": get("URL"),
+            "id": f"{uid}@{start_date}", # unique id of the occurrence, see issue 69
             "type": "event",
-            "color": calendar_event.get("COLOR", calendar_event.get("X-APPLE-CALENDAR-COLOR", "")),
+            "color": get("COLOR", get("X-APPLE-CALENDAR-COLOR", "")),
             "categories": categories,
         }
+        if self.include_ical:
+            event["ical"] = calendar_event.to_ical().decode("UTF-8")
+        return event
 
     def convert_error(self, error, url, tb_s):
         """Create an error which can be used by the dhtmlx scheduler."""
@@ -104,26 +174,29 @@ class ConvertToDhtmlx(ConversionStrategy):
         }
 
     def merge(self):
-        return jsonify(self.components)
+        # orjson serializes the events much faster than the stdlib json
+        # used by jsonify.
+        return Response(orjson.dumps(self.components), mimetype="application/json")
 
     def collect_components_from(self, calendars):
         # see https://stackoverflow.com/a/16115575/1320237
         today = (
             parse_date(self.specification["date"])
             if self.specification.get("date")
-            else datetime.datetime.utcnow()
+            else datetime.datetime.now(datetime.timezone.utc)
         )
         to_date = (
             parse_date(self.specification["to"])
             if self.specification.get("to")
-            else today.replace(year=today.year + 1)
+            else today + ONE_YEAR
         )
         from_date = (
             parse_date(self.specification["from"])
             if self.specification.get("from")
-            else today.replace(year=today.year - 1)
+            else today - ONE_YEAR
         )
         for calendar in calendars:
+            calendar = without_events_outside(calendar, from_date, to_date)
             events = recurring_ical_events.of(calendar).between(from_date, to_date)
             with self.lock:
                 for event in events:
@@ -0,0 +1,84 @@
+"""Test the pre-filter which removes events before the rrule expansion.
+
+Events which cannot occur in the requested time span are dropped
+before recurring_ical_events iterates their occurrences.
+Events which might occur in the time span must be kept.
+"""
+import datetime
+import icalendar
+import pytest
+from convert_to_dhtmlx import without_events_outside
+
+FROM_DATE = datetime.datetime(2020, 1, 1)
+TO_DATE = datetime.datetime(2020, 2, 1)
+
+
+def calendar_with_event(**properties):
+    """Return a calendar with one event built from the properties."""
+    calendar = icalendar.Calendar()
+    calendar["VERSION"] = "2.0"
+    event = icalendar.Event()
+    event.add("UID", "test-event")
+    for name, value in properties.items():
+        event.add(name.replace("_", "-"), value)
+    calendar.add_component(event)
+    return calendar
+
+
+@pytest.mark.parametrize("kept,properties", [
+    # an event inside the time span is kept
+    (True, {"DTSTART": datetime.datetime(2020, 1, 10, 10)}),
+    # an event starting after the time span is dropped
+    (False, {"DTSTART": datetime.datetime(2021, 1, 1, 10)}),
+    # an event ending before the time span is dropped
+    (False, {"DTSTART": datetime.datetime(2019, 1, 1, 10),
+             "DTEND": datetime.datetime(2019, 1, 1, 11)}),
+    # an event close to the boundary is kept because of the margin
+    (True, {"DTSTART": datetime.datetime(2019, 12, 31, 23)}),
+    # a recurring event with UNTIL before the time span is dropped
+    (False, {"DTSTART": datetime.datetime(2019, 1, 1, 10),
+             "RRULE": {"FREQ": ["DAILY"], "UNTIL": [datetime.datetime(2019, 6, 1)]}}),
+    # a recurring event without UNTIL recurs into the time span
+    (True, {"DTSTART": datetime.datetime(2019, 1, 1, 10),
+            "RRULE": {"FREQ": ["DAILY"]}}),
+    # an event with RDATE is kept because the dates can be anywhere
+    (True, {"DTSTART": datetime.datetime(2019, 1, 1, 10),
+            "RDATE": datetime.datetime(2020, 1, 10, 10)}),
+    # a long event with DURATION reaches into the time span
+    (True, {"DTSTART": datetime.datetime(2019, 12, 1, 10),
+            "DURATION": datetime.timedelta(days=40)}),
+    # the last occurrence before UNTIL lasts into the time span
+    (True, {"DTSTART": datetime.datetime(2019, 10, 1, 10),
+            "DURATION": datetime.timedelta(days=10),
+            "RRULE": {"FREQ": ["WEEKLY"], "UNTIL": [datetime.datetime(2019, 12, 24, 10)]}}),
+    # the last occurrence before UNTIL also ends before the time span
+    (False, {"DTSTART": datetime.datetime(2019, 10, 1, 10),
+             "DURATION": datetime.timedelta(days=10),
+             "RRULE": {"FREQ": ["WEEKLY"], "UNTIL": [datetime.datetime(2019, 12, 10, 10)]}}),
+])
+def test_events_outside_the_time_span_are_removed(kept, properties):
+    calendar = calendar_with_event(**properties)
+    slimmed_calendar = without_events_outside(calendar, FROM_DATE, TO_DATE)
+    assert bool(slimmed_calendar.subcomponents) == kept
+
+
+def test_modified_occurrences_keep_their_event():
+    """An event with a modified occurrence is never dropped."""
+    calendar = calendar_with_event(
+        DTSTART=datetime.datetime(2019, 1, 1, 10),
+        RRULE={"FREQ": ["DAILY"], "UNTIL": [datetime.datetime(2019, 6, 1)]})
+    modification = icalendar.Event()
+    modification.add("UID", "test-event")
+    modification.add("DTSTART", datetime.datetime(2020, 1, 10, 10))
+    modification.add("RECURRENCE-ID", datetime.datetime(2019, 5, 1, 10))
+    calendar.add_component(modification)
+    slimmed_calendar = without_events_outside(calendar, FROM_DATE, TO_DATE)
+    assert len(slimmed_calendar.subcomponents) == 2
+
+
+def test_timezones_are_kept():
+    """Other components like VTIMEZONE pass through the filter."""
+    calendar = calendar_with_event(DTSTART=datetime.datetime(2021, 1, 1, 10))
+    calendar.add_component(icalendar.Timezone())
+    slimmed_calendar = without_events_outside(calendar, FROM_DATE, TO_DATE)
+    assert [c.name for c in slimmed_calendar.subcomponents] == ["VTIMEZONE"]
@@ -2,17 +2,24 @@
 Test the caching functionality which will be used by subsequent tests.
 
 """
-from app import cache_url, get_text_from_url, requests
+from app import cache_url, get_text_from_url, cache, SESSION
 from collections import namedtuple
+from types import SimpleNamespace
 import pytest
 
 # use the content property
 # see https://stackoverflow.com/a/18810889/1320237
-MockRequestResult = namedtuple("MockRequestResult", "content")
+class MockRequestResult(namedtuple(
+        "MockRequestResult", ["content", "raw", "status_code", "headers"])):
+
+    def close(self):
+        """Responses are closed without reading them on a 304."""
+
+MockRequestResult.__new__.__defaults__ = (SimpleNamespace(), 200, {})
 
 def test_requests_are_automatically_cached(monkeypatch, mock):
     mock.return_value = MockRequestResult("trallala")
-    monkeypatch.setattr(requests, "get", mock)
+    monkeypatch.setattr(SESSION, "get", mock)
     assert get_text_from_url("https://asd.asd") == "trallala"
     assert get_text_from_url("https://asd.asd") == "trallala"
     mock.assert_called_once()
@@ -26,6 +33,26 @@ def test_caching_twice_works():
     cache_url("http://asd.asd", "asd")
     assert get_text_from_url("http://asd.asd") == "asd"
 
+def test_expired_cache_revalidates_with_a_conditional_request(monkeypatch):
+    """A 304 answer to the conditional request returns the stored body."""
+    url = "https://etag.example/calendar.ics"
+    sent_headers = []
+    responses = iter([
+        MockRequestResult("body-1", headers={"ETag": '"version-1"'}),
+        MockRequestResult("", status_code=304),
+    ])
+    def get(url, headers=None, **kw):
+        sent_headers.append(headers)
+        return next(responses)
+    monkeypatch.setattr(SESSION, "get", get)
+    assert get_text_from_url(url) == "body-1"
+    # let the memoized value expire
+    cache.delete_memoized(get_text_from_url, url)
+    assert get_text_from_url(url) == "body-1"
+    assert "If-None-Match" not in sent_headers[0]
+    assert sent_headers[1]["If-None-Match"] == '"version-1"'
+
+
 def test_requests_are_forbidden():
     import requests
     with pytest.raises(RuntimeError):